@@ -20,4 +20,7 @@ fi
 $FT_PATH/fasttext supervised -input ${DATA_DIR}/${BASE}/${BASE}.samples.train -output ${DATA_DIR}/${BASE}/${BASE} -lr 1.0 -dim 50 -epoch 2
 #  check against validation set
 $FT_PATH/fasttext test ${DATA_DIR}/${BASE}/${BASE}.bin ${DATA_DIR}/${BASE}/${BASE}.samples.validate
-
+#  product-quantize the model: .ftz is ~10x smaller and faster to serve
+$FT_PATH/fasttext quantize -input ${DATA_DIR}/${BASE}/${BASE}.samples.train -output ${DATA_DIR}/${BASE}/${BASE} -qnorm -retrain -cutoff 200000
+#  check quantized model against validation set
+$FT_PATH/fasttext test ${DATA_DIR}/${BASE}/${BASE}.ftz ${DATA_DIR}/${BASE}/${BASE}.samples.validate
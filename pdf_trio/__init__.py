@@ -15,12 +15,12 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 import sys
 import html
+import subprocess
 from io import BytesIO
-import raven
-from raven.contrib.flask import Sentry
-from flask import Flask, Request
+from flask import Flask, Request, Response
 
 # this is the canonical location for version of this module
 __version__ = "0.1.1"
@@ -37,8 +37,9 @@ def create_app(test_config=None):
     app.request_class = RAMOnlyRequest
 
     try:
-        GIT_RELEASE = raven.fetch_git_sha('.')
-    except Exception as e:
+        GIT_RELEASE = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.PIPE).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError) as e:
         print("WARNING: couldn't set sentry git release automatically: " + str(e),
             file=sys.stderr)
         GIT_RELEASE = None
@@ -53,8 +54,12 @@ def create_app(test_config=None):
         },
     )
 
-    # Grabs sentry config from SENTRY_DSN environment variable
-    sentry = Sentry(app)
+    # Grabs sentry config from SENTRY_DSN environment variable. Without a DSN
+    # there is nothing to report to, so the client (and its per-request
+    # middleware) is not installed at all
+    if os.environ.get('SENTRY_DSN'):
+        from raven.contrib.flask import Sentry
+        Sentry(app)
 
     @app.route('/', methods = ['GET'])
     def toplevel():
@@ -65,35 +70,49 @@ def create_app(test_config=None):
         """
         Show the REST api.
         """
-        # build HTML of the method list
-        apilist = []
-        rules = sorted(app.url_map.iter_rules(), key=lambda x: str(x))
-        for rule in rules:
-            f = app.view_functions[rule.endpoint]
-            docs = f.__doc__ or ''
-
-            # remove noisy OPTIONS
-            methods = sorted([x for x in rule.methods if x != "OPTIONS"])
-            url = html.escape(str(rule))
-            apilist.append("<div><a href='{}'><b>{}</b></a> {}<br/>{}</div>".format(
-                url, url, methods, docs))
-
-        header = """<body>
-            <style>
-                body { width: 80%; margin: 20px auto;
-                     font-family: Courier; }
-                section { background: #eee; padding: 40px 20px;
-                    border: 1px dashed #aaa; }
-            </style>
-            <section>
-            <h2>REST API (_COUNT_ end-points)</h2>
-            """.replace('_COUNT_', str(len(apilist)))
-        footer = "</section></body>"
-
-        return header + "<br/>".join(apilist) + footer
+        return Response(api_list_html, mimetype='text/html')
 
     from pdf_trio import api_routes
 
     app.register_blueprint(api_routes.bp)
 
+    # load the models now: when the app is created before forking workers
+    # (uwsgi default, gunicorn --preload) they share the pages copy-on-write
+    api_routes.get_pdf_classifier()
+    api_routes.get_url_classifier()
+
+    # routes are fixed from here on, so render (and encode) the listing just once
+    api_list_html = render_api_list(app).encode('utf-8')
+
     return app
+
+
+def render_api_list(app):
+    """
+    Build HTML of the method list for all routes of app.
+    """
+    apilist = []
+    rules = sorted(app.url_map.iter_rules(), key=lambda x: str(x))
+    for rule in rules:
+        f = app.view_functions[rule.endpoint]
+        docs = f.__doc__ or ''
+
+        # remove noisy OPTIONS
+        methods = sorted([x for x in rule.methods if x != "OPTIONS"])
+        url = html.escape(str(rule))
+        apilist.append("<div><a href='{}'><b>{}</b></a> {}<br/>{}</div>".format(
+            url, url, methods, docs))
+
+    header = """<body>
+        <style>
+            body { width: 80%; margin: 20px auto;
+                 font-family: Courier; }
+            section { background: #eee; padding: 40px 20px;
+                border: 1px dashed #aaa; }
+        </style>
+        <section>
+        <h2>REST API (_COUNT_ end-points)</h2>
+        """.replace('_COUNT_', str(len(apilist)))
+    footer = "</section></body>"
+
+    return header + "<br/>".join(apilist) + footer
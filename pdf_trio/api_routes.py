@@ -17,6 +17,7 @@ limitations under the License.
 
 import time
 import logging
+import threading
 
 from flask import request, jsonify, abort, Blueprint, current_app
 from pdf_trio import pdf_classifier, url_classifier
@@ -28,8 +29,34 @@ log.info("STARTING   STARTING   STARTING   STARTING   STARTING   STARTING   STAR
 
 bp = Blueprint("classify", __name__)
 
-bp.pdf_classifier = pdf_classifier.PdfClassifier()
-bp.url_classifier = url_classifier.UrlClassifier()
+# classifiers load large models, so they are created on first use rather than
+# at import time; see get_pdf_classifier(), get_url_classifier()
+bp.pdf_classifier = None
+bp.url_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_pdf_classifier():
+    """
+    The shared PdfClassifier, created on first call.
+    """
+    if bp.pdf_classifier is None:
+        with _classifier_lock:
+            if bp.pdf_classifier is None:
+                bp.pdf_classifier = pdf_classifier.PdfClassifier()
+    return bp.pdf_classifier
+
+
+def get_url_classifier():
+    """
+    The shared UrlClassifier, created on first call.
+    """
+    if bp.url_classifier is None:
+        with _classifier_lock:
+            if bp.url_classifier is None:
+                bp.url_classifier = url_classifier.UrlClassifier()
+    return bp.url_classifier
+
 
 @bp.route('/classify/research-pub/url', methods = ['POST'])
 def classify_by_url():
@@ -38,16 +65,14 @@ def classify_by_url():
     A PDF under arxiv.org has a high confidence of being a research work.
     A PDF under amazon.com has a low confidence of being a research work.
     Parameter urls= in POST: json list of URLs like ["http://foo.com", "http://bar.com"]
-    Each URL is separately classified.
+    Each URL is separately classified (in one batch).
     :return: json { "url1": 0.88, "url2": 0.92, "url3": 0.23 }
     """
     start_ts = int(time.time()*1000)
     input = request.json or {}
     url_list = input.get('urls')
-    results_map = {}
-    for url in url_list:
-        confidence = bp.url_classifier.classify_url(url)
-        results_map[url] = confidence
+    confidences = get_url_classifier().classify_urls(url_list)
+    results_map = dict(zip(url_list, confidences))
     log.debug("results_map=%s" % (results_map))
     retmap = {"predictions": results_map}
     return jsonify(retmap)
@@ -84,7 +109,7 @@ def classify_pdf(ctype):
     pdf_stream = pdf_filestorage.stream
     pdf_content = pdf_stream.read()
     log.debug("type=%s  pdf_content for %s with length %d" % (ctype, filename, len(pdf_content)))
-    results = bp.pdf_classifier.classify_pdf_multi(ctype, pdf_content, filename)
+    results = get_pdf_classifier().classify_pdf_multi(ctype, pdf_content, filename)
     if current_app.config['GIT_REV']:
         results['versions']['git_rev'] = current_app.config['GIT_REV']
     if current_app.config['VERSION']:
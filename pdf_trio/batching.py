@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2020 Internet Archive
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+
+Server-side adaptive batching of back-end inference calls.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+
+class Batcher:
+    """
+    Coalesces concurrent single-example calls into one call of batch_fn.
+
+    Callers (eg, request threads) submit one example at a time. A background
+    worker thread collects examples until either max_batch_size examples are
+    queued or max_latency_ms has passed since the first one arrived, then calls
+    batch_fn once with the list of examples. batch_fn must return a list of
+    results in the same order, which are routed back to each caller.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_latency_ms=10, name="batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, max_latency_ms / 1000.0)
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def __call__(self, example):
+        """
+        Submit one example and block until its result is available.
+        """
+        return self.submit(example).result()
+
+    def submit(self, example):
+        """
+        Submit one example for batched processing.
+
+        :param example: one item, as batch_fn expects in its list.
+        :return: concurrent.futures.Future for the result of that example.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((example, future))
+        return future
+
+    def _ensure_worker(self):
+        """
+        Start the worker thread on first use. Threads do not survive fork(), so
+        under pre-forking servers (uwsgi, gunicorn) each worker process needs
+        its own.
+        """
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # the queue's internal locks may be held by a thread which no
+                # longer exists in this process
+                self._queue = queue.Queue()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="%s-%d" % (self.name, pid),
+                daemon=True,
+            )
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        batch.append(self._queue.get(timeout=timeout))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        examples = [example for example, _ in batch]
+        try:
+            results = self.batch_fn(examples)
+            if len(results) != len(examples):
+                raise ValueError("%s: got %d results for a batch of %d" %
+                    (self.name, len(results), len(examples)))
+        except Exception as e:
+            log.warning("%s: batch of %d failed: %s", self.name, len(examples), e)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        log.debug("%s: dispatched batch of %d", self.name, len(examples))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+Copyright 2020 Internet Archive
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+
+In-memory caching of results keyed by PDF content.
+"""
+
+import collections
+import hashlib
+import threading
+
+
+def content_key(content):
+    """
+    Compact key for caching by content. BLAKE2 is faster than SHA-1/SHA-256
+    and is in the standard library.
+
+    :param content: binary string object, eg, PDF bytes.
+    :return: 16 byte digest.
+    """
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class LruCache:
+    """
+    Thread-safe map holding at most maxsize entries, evicting the least
+    recently used. A maxsize of 0 disables caching.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -22,19 +22,52 @@ Inference drivers for CNN, FastText, and BERT for PDF classification here.
 import os
 import time
 import json
+import base64
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import fasttext
+try:
+    import orjson  # optional, much faster encoding of numpy arrays
+except ImportError:
+    orjson = None
 
 from pdf_trio import text_prep
 from pdf_trio import pdf_util
+from pdf_trio.batching import Batcher
+from pdf_trio.cache import LruCache, content_key
 
 
 
 log = logging.getLogger(__name__)
 
+# compact encoding for tensorflow-serving payloads: the default separators add
+# a space after every one of the thousands of numbers in each request
+JSON_SEPARATORS = (',', ':')
+
+# BERT inputs are always padded to 512 values
+BERT_MAX_TOKENS = 512
+# read-only, shared by all requests
+BERT_SEGMENT_IDS = np.zeros(BERT_MAX_TOKENS, dtype=np.int32)
+BERT_SEGMENT_IDS.flags.writeable = False
+
+
+def encode_json_request(req):
+    """
+    Serialize a tensorflow-serving request body, which may contain numpy arrays.
+
+    :param req: map to encode as JSON
+    :return: JSON as bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(req, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(req, separators=JSON_SEPARATORS,
+        default=lambda o: o.tolist()).encode('utf-8')
+
 
 class PdfClassifier:
 
@@ -44,12 +77,38 @@ class PdfClassifier:
         self.version_map = {}
         self.json_content_header = {"Content-Type": "application/json"}
 
+        # one pooled, keep-alive session for all tensorflow-serving calls, so
+        # each inference does not pay for a new TCP connection
+        self.http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, read=0, status=0, backoff_factor=0.1),
+        )
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
+        # (connect, read) timeouts in seconds
+        self.http_timeout = (2, 30)
+
         image_server_prefix = os.environ.get('TF_IMAGE_SERVER_URL')
         if not image_server_prefix:
             raise ValueError('Missing TF image classifier URL config, ' +
                 'define env var TF_IMAGE_SERVER_URL')
         self.image_tf_server_url = image_server_prefix + "/models/image_model"
         # self.version_map['image'] is lazy-loaded
+        # "json": pixel values as JSON numbers (default, works with the released model)
+        # "raw_b64": raw tensor bytes, base64 encoded; needs a servable
+        #   with a DT_STRING input which does tf.io.decode_raw()
+        # "jpeg_b64": JPEG encoded images, base64 encoded; needs a servable
+        #   with a DT_STRING input which does tf.io.decode_jpeg()
+        self.image_input_format = os.environ.get('TF_IMAGE_INPUT_FORMAT') or "json"
+        if self.image_input_format not in ("json", "raw_b64", "jpeg_b64"):
+            raise ValueError('TF_IMAGE_INPUT_FORMAT must be one of: json, raw_b64, jpeg_b64')
+        # element type of the raw_b64 tensor bytes; float16 halves the payload
+        image_input_dtype = os.environ.get('TF_IMAGE_INPUT_DTYPE') or "float32"
+        if image_input_dtype not in ("float32", "float16"):
+            raise ValueError('TF_IMAGE_INPUT_DTYPE must be one of: float32, float16')
+        self.image_input_dtype = np.dtype(image_input_dtype)
 
         bert_server_prefix = os.environ.get('TF_BERT_SERVER_URL')
         if not bert_server_prefix :
@@ -61,10 +120,11 @@ class PdfClassifier:
         vocab_path = os.environ.get('TF_BERT_VOCAB_PATH')
         if not vocab_path:
             raise ValueError('TF_BERT_VOCAB_PATH is not set to the path to vocab.txt')
-        if not os.path.exists(vocab_path) and os.path.isfile(vocab_path):
-            raise ValueError('TF_BERT_VOCAB_PATH target does not exist: %s' % vocab_path)
         log.warning("Loading BERT model vocabulary...")
-        self.bert_vocab = text_prep.load_bert_vocab(vocab_path)
+        try:
+            self.bert_vocab = text_prep.load_bert_vocab(vocab_path)
+        except OSError as e:
+            raise ValueError('TF_BERT_VOCAB_PATH target can not be read: %s (%s)' % (vocab_path, e))
 
         model_path = os.environ.get('FT_MODEL')
         if not model_path:
@@ -73,16 +133,44 @@ class PdfClassifier:
         log.warning("Loading fasttext model...")
         self.fasttext_model = fasttext.load_model(model_path)
         self.version_map["linear_model"] = os.environ.get('FT_MODEL_VERSION') or None
+        # in 'auto' mode BERT is only consulted when the linear score falls in
+        # [low, high]; a narrower gap skips more BERT calls
+        self.auto_bert_low = float(os.environ.get('PDFTRIO_AUTO_BERT_LOW') or 0.15)
+        self.auto_bert_high = float(os.environ.get('PDFTRIO_AUTO_BERT_HIGH') or 0.85)
+        # optional cap on tokens given to fastText (head and tail of the doc), 0 for all
+        self.linear_max_tokens = int(os.environ.get('PDFTRIO_LINEAR_MAX_TOKENS') or 0)
 
         self.version_map["models_date"] = os.environ.get('PDFTRIO_MODELS_DATE') or None
 
-    @staticmethod
-    def get_tf_model_version(url):
+        # concurrent requests are coalesced into batched tensorflow-serving calls
+        batch_max_size = int(os.environ.get('PDFTRIO_BATCH_MAX_SIZE') or 32)
+        batch_max_latency_ms = float(os.environ.get('PDFTRIO_BATCH_MAX_LATENCY_MS') or 10)
+        self.bert_batcher = Batcher(self.predict_bert_batch,
+            batch_max_size, batch_max_latency_ms, name="bert")
+        self.image_batcher = Batcher(self.predict_image_batch,
+            batch_max_size, batch_max_latency_ms, name="image")
+
+        # runs independent classifier stages of one request concurrently
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('PDFTRIO_STAGE_THREADS') or 16),
+            thread_name_prefix="pdftrio-stage",
+        )
+
+        # scores of recently classified PDFs, keyed by (modes, content hash);
+        # re-submitted PDFs (crawl retries, duplicates) are answered from here
+        self.result_cache = LruCache(int(os.environ.get('PDFTRIO_RESULT_CACHE_SIZE') or 1024))
+        # extracted tokens (and their joined form for fastText), keyed by
+        # content hash, so a re-submit with other modes skips pdftotext
+        token_cache_size = int(os.environ.get('PDFTRIO_TOKEN_CACHE_SIZE') or 64)
+        self.token_cache = LruCache(token_cache_size)
+        self.linear_text_cache = LruCache(token_cache_size)
+
+    def get_tf_model_version(self, url):
         """
         Connect to back-end tensorflow-serving APIs and fetch model version
         metadata
         """
-        resp = requests.get(url)
+        resp = self.http.get(url, timeout=self.http_timeout)
         resp.raise_for_status()
         status = resp.json()['model_version_status'][0]
         assert status['state'] == "AVAILABLE"
@@ -125,6 +213,15 @@ class PdfClassifier:
         """
 
         self.lazy_load_versions()
+        start = time.time()
+        pdf_key = content_key(pdf_content)
+        cache_key = (modes, pdf_key)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            results = dict(cached)
+            results['versions'] = self.version_map
+            results['timing'] = {'result_cache': time.time() - start}
+            return results
         results = {"versions": self.version_map}
         timing = dict()
         confidence_values = []
@@ -133,68 +230,55 @@ class PdfClassifier:
         # rewrite mode_list if 'all' is requested
         if 'all' in mode_list:
             mode_list = ['image', 'linear', 'bert']
+        # the image classifier does not depend on the text, so when it is
+        # requested by name, start it now, concurrently with text extraction
+        image_future = None
+        if 'image' in mode_list and 'auto' not in mode_list:
+            image_future = self.executor.submit(
+                self.classify_pdf_image_stage, pdf_content, trace_name, timing)
         # look ahead to see if text is required, so we can extract that now
+        # False if text extraction or image rendering failed or timed out
+        tokens_complete = True
+        image_complete = True
         if ('linear' in mode_list) or ('bert' in mode_list) or ('auto' in mode_list):
-            # extract text
-            start = time.time()
-            pdf_raw_text = pdf_util.extract_pdf_text(pdf_content, trace_name)
-            timing['extract_text'] = time.time() - start
-            if len(pdf_raw_text) < 300:
-                pdf_token_list = []  # too short to be useful
-            else:
-                pdf_token_list = text_prep.extract_tokens(pdf_raw_text)
+            pdf_token_list, tokens_complete = self.get_pdf_tokens(pdf_key, pdf_content, trace_name, timing)
         if 'auto' in mode_list:
             # start with fastest, use confidence thresholds to short circuit
             if len(pdf_token_list) != 0:
                 # FastText
                 start = time.time()
-                confidence_linear = self.classify_pdf_linear(pdf_token_list)
+                confidence_linear = self.classify_pdf_linear(pdf_token_list,
+                    pdf_text=self.get_linear_text(pdf_key, pdf_token_list, cache=tokens_complete))
                 timing['classify_linear'] = time.time() - start
                 results['linear_score'] = confidence_linear
                 confidence_values.append(confidence_linear)
-                if .85 >= confidence_linear >= 0.15:
+                if self.auto_bert_high >= confidence_linear >= self.auto_bert_low:
                     # also check BERT
-                    pdf_token_list_trimmed = text_prep.trim_tokens(pdf_token_list, 512)
-                    start = time.time()
-                    confidence_bert = self.classify_pdf_bert(pdf_token_list_trimmed)
-                    timing['classify_bert'] = time.time() - start
+                    confidence_bert = self.classify_pdf_bert_stage(pdf_token_list, timing)
                     results['bert_score'] = confidence_bert
                     confidence_values.append(confidence_bert)
             else:
                 # no tokens, so use image
-                start = time.time()
-                image_array_page0 = pdf_util.extract_pdf_image(pdf_content, trace_name)
-                if image_array_page0 is not None:
-                    timing['extract_image'] = time.time() - start
-                    # classify pdf_image_page0
-                    start = time.time()
-                    confidence_image = self.classify_pdf_image(image_array_page0, trace_name)
-                    timing['classify_image'] = time.time() - start
+                confidence_image, image_complete = self.classify_pdf_image_stage(
+                    pdf_content, trace_name, timing)
+                if confidence_image is not None:
                     results['image_score'] = confidence_image
                     confidence_values.append(confidence_image)
         else:
-            # apply named classifiers
+            # apply named classifiers; BERT (remote) runs concurrently with
+            # the (local) linear classifier
+            bert_future = None
             for classifier in mode_list:
                 if classifier == "image":
-                    start = time.time()
-                    image_array_page0 = pdf_util.extract_pdf_image(pdf_content, trace_name)
-                    timing['extract_image'] = time.time() - start
-                    if image_array_page0 is None:
-                        log.debug("no jpg for %s" % (trace_name))
-                        continue  # skip
-                    # classify image_array_page0
-                    start = time.time()
-                    confidence_image = self.classify_pdf_image(image_array_page0, trace_name)
-                    timing['classify_image'] = time.time() - start
-                    results['image_score'] = confidence_image
-                    confidence_values.append(confidence_image)
+                    continue  # already started
                 elif classifier == "linear":
                     if len(pdf_token_list) == 0:
                         # cannot use this classifier if no tokens extracted
                         log.debug("no tokens extracted for %s" % (trace_name))
                         continue  # skip
                     start = time.time()
-                    confidence_linear = self.classify_pdf_linear(pdf_token_list)
+                    confidence_linear = self.classify_pdf_linear(pdf_token_list,
+                        pdf_text=self.get_linear_text(pdf_key, pdf_token_list, cache=tokens_complete))
                     timing['classify_linear'] = time.time() - start
                     results['linear_score'] = confidence_linear
                     confidence_values.append(confidence_linear)
@@ -203,23 +287,121 @@ class PdfClassifier:
                         # cannot use this classifier if no tokens extracted
                         log.debug("no tokens extracted for %s" % (trace_name))
                         continue  # skip
-                    pdf_token_list_trimmed = text_prep.trim_tokens(pdf_token_list, 512)
-                    start = time.time()
-                    confidence_bert = self.classify_pdf_bert(pdf_token_list_trimmed)
-                    timing['classify_bert'] = time.time() - start
-                    results['bert_score'] = confidence_bert
-                    confidence_values.append(confidence_bert)
+                    if bert_future is None:
+                        bert_future = self.executor.submit(
+                            self.classify_pdf_bert_stage, pdf_token_list, timing)
                 else:
                     log.warning("ignoring unknown classifier ref: " + classifier)
+            if bert_future is not None:
+                confidence_bert = bert_future.result()
+                results['bert_score'] = confidence_bert
+                confidence_values.append(confidence_bert)
+            if image_future is not None:
+                confidence_image, image_complete = image_future.result()
+                if confidence_image is not None:
+                    results['image_score'] = confidence_image
+                    confidence_values.append(confidence_image)
         #  compute 'ensemble_score ' using confidence_values
         if len(confidence_values) != 0:
             confidence_overall = sum(confidence_values) / len(confidence_values)
             # insert confidence_overall
             results['ensemble_score'] = confidence_overall
+            # a retry of a PDF whose extraction did not complete must not get
+            # the (weaker) ensemble made without it
+            if tokens_complete and image_complete:
+                self.result_cache.put(cache_key,
+                    {k: v for k, v in results.items() if k != 'versions'})
         results['timing'] = timing
         return results
 
 
+    def classify_pdf_image_stage(self, pdf_content, trace_name, timing):
+        """
+        Extract the first page image and apply the image model to it.
+
+        :param pdf_content: as binary string object.
+        :param trace_name the filename on the client, for traceability
+        :param timing: map to record extraction and classification times in
+        :return: tuple of (encoded confidence, or None if no image could be
+            produced; False if rendering failed or timed out)
+        """
+        start = time.time()
+        images, complete = pdf_util.extract_pdf_images_status(pdf_content, trace_name, pages=(0,))
+        timing['extract_image'] = time.time() - start
+        image_array_page0 = images.get(0)
+        if image_array_page0 is None:
+            log.debug("no jpg for %s" % (trace_name))
+            return None, complete
+        # classify image_array_page0
+        start = time.time()
+        confidence_image = self.classify_pdf_image(image_array_page0, trace_name)
+        timing['classify_image'] = time.time() - start
+        return confidence_image, complete
+
+    def classify_pdf_bert_stage(self, pdf_token_list, timing):
+        """
+        Trim tokens to the BERT maximum and apply the BERT model.
+
+        :param pdf_token_list: tokens list from pdf content, not empty
+        :param timing: map to record classification time in
+        :return: encoded confidence
+        """
+        pdf_token_list_trimmed = text_prep.trim_tokens(pdf_token_list, 512)
+        start = time.time()
+        confidence_bert = self.classify_pdf_bert(pdf_token_list_trimmed)
+        timing['classify_bert'] = time.time() - start
+        return confidence_bert
+
+    def get_pdf_tokens(self, pdf_key, pdf_content, trace_name, timing):
+        """
+        Extract text from the PDF and tokenize it, memoized by content hash.
+
+        :param pdf_key: content_key() of pdf_content
+        :param pdf_content: as binary string object.
+        :param trace_name the filename on the client, for traceability
+        :param timing: map to record extraction time in, if not cached
+        :return: tuple of (token list, complete): the token list is empty if too
+            little text to be useful, and shared with the cache, so must not be
+            modified; complete is False if extraction failed or timed out, in
+            which case the tokens are partial and were not cached.
+        """
+        pdf_token_list = self.token_cache.get(pdf_key)
+        if pdf_token_list is not None:
+            return pdf_token_list, True
+        # extract text
+        start = time.time()
+        pdf_raw_text, complete = pdf_util.extract_pdf_text_status(pdf_content, trace_name)
+        timing['extract_text'] = time.time() - start
+        if len(pdf_raw_text) < 300:
+            pdf_token_list = []  # too short to be useful
+        else:
+            pdf_token_list = text_prep.extract_tokens(pdf_raw_text)
+        if complete:
+            self.token_cache.put(pdf_key, pdf_token_list)
+        return pdf_token_list, complete
+
+    def get_linear_text(self, pdf_key, pdf_token_list, cache=True):
+        """
+        The token list joined into one string for fastText, memoized by content
+        hash unless cache is False (for tokens of a partial extraction).
+        """
+        pdf_text = self.linear_text_cache.get(pdf_key) if cache else None
+        if pdf_text is None:
+            pdf_text = self.join_linear_tokens(pdf_token_list)
+            if cache:
+                self.linear_text_cache.put(pdf_key, pdf_text)
+        return pdf_text
+
+    def join_linear_tokens(self, pdf_token_list):
+        """
+        Build the fastText input string: the tokens joined by spaces, trimmed
+        to the head and tail of the document if PDFTRIO_LINEAR_MAX_TOKENS is set.
+        """
+        if self.linear_max_tokens > 0:
+            pdf_token_list = text_prep.trim_tokens(pdf_token_list, self.linear_max_tokens)
+        return " ".join(pdf_token_list)
+
+
     @staticmethod
     def encode_confidence(label, confidence):
         """
@@ -256,15 +438,18 @@ class PdfClassifier:
         return "research", (2 * e) - 1.0
 
 
-    def classify_pdf_linear(self, pdf_token_list):
+    def classify_pdf_linear(self, pdf_token_list, pdf_text=None):
         """
         Apply fastText model to content
 
         :param pdf_tokens: cleaned tokens list from pdf content
+        :param pdf_text: join_linear_tokens() of the tokens, if already available
         :return: encoded confidence as type float with range [0.5,1.0] that example is positive
         """
+        if pdf_text is None:
+            pdf_text = self.join_linear_tokens(pdf_token_list)
         #  classify using fastText model
-        results = self.fasttext_model.predict(" ".join(pdf_token_list))
+        results = self.fasttext_model.predict(pdf_text)
         label = results[0][0]
         confidence = results[1][0]
         log.debug("classify_pdf_linear: label=%s confidence=%.2f" % (label, confidence))
@@ -280,90 +465,120 @@ class PdfClassifier:
         :return: encoded confidence as type float with range [0.5,1.0] that example is positive
         """
         token_ids = text_prep.convert_to_bert_vocab(self.bert_vocab, pdf_token_list)
-        tcount = len(token_ids)
-        if tcount < 512:
-            for j in range(tcount, 512):
-                token_ids.append(0)
-        # add entries so that token_ids is 512 length
-        # for REST request, need examples=[{"input_ids": [], "input_mask":[], "label_ids":[0], "segment_ids":[]}]
-        input_ids = token_ids
-        if tcount < 512:
-            input_mask = np.concatenate(
-                (np.ones(tcount, dtype=int), np.zeros(512-tcount, dtype=int)),
-                axis=0,
-            ).tolist()
+        tcount = min(len(token_ids), BERT_MAX_TOKENS)
+        # zero padded so that input_ids is 512 length
+        input_ids = np.zeros(BERT_MAX_TOKENS, dtype=np.int32)
+        input_ids[:tcount] = token_ids[:tcount]
+        input_mask = np.zeros(BERT_MAX_TOKENS, dtype=np.int32)
+        input_mask[:tcount] = 1
+        segment_ids = BERT_SEGMENT_IDS
+        response_vec = self.bert_batcher({
+            "input_ids": input_ids,
+            "input_mask": input_mask,
+            "segment_ids": segment_ids,
+        })
+        confidence_other = response_vec[0]
+        confidence_research = response_vec[1]
+        log.debug("bert classify %s  other=%.2f research=%.2f",
+            trace_id, confidence_other, confidence_research)
+        if confidence_research > confidence_other:
+            ret = self.encode_confidence("research", confidence_research)
+        else:
+            ret = self.encode_confidence("other", confidence_other)
+        return ret
+
+
+    def classify_pdf_image(self, img_as_array, trace_name):
+        """
+        Apply image model to content image using tensorflow-serving.
+
+        :param img_as_array: image as array with shape (IMAGE_SIZE, IMAGE_SIZE, 3).
+        :param trace_name: name for tracing an example, used in log msgs.
+        :return: encoded confidence as type float with range [0.5,1.0] that example is positive
+        """
+        response_vec = self.image_batcher(np.reshape(img_as_array, (pdf_util.IMAGE_SIZE, pdf_util.IMAGE_SIZE, 3)))
+        confidence_other = response_vec[0]
+        confidence_research = response_vec[1]
+        log.debug("image classify %s  other=%.2f research=%.2f",
+            trace_name, confidence_other, confidence_research)
+        if confidence_research > confidence_other:
+            ret = self.encode_confidence("research", confidence_research)
         else:
-            input_mask = np.ones(512, dtype=int).tolist()
-        label_ids = [0]  # dummy, one int, not needed for prediction
-        segment_ids = np.zeros(512, dtype=int).tolist()
+            ret = self.encode_confidence("other", confidence_other)
+        return ret
+
+
+    def predict_bert_batch(self, examples):
+        """
+        Run one tensorflow-serving BERT prediction for a batch of examples.
+
+        :param examples: list of maps with "input_ids", "input_mask" and
+            "segment_ids", each an int32 array of 512.
+        :return: list of [confidence_other, confidence_research], one per example.
+        """
+        # for REST request, need examples=[{"input_ids": [], "input_mask":[], "label_ids":[0], "segment_ids":[]}]
         # The released BERT graph has been tweaked to use 4 input placeholders,
         #   so we use "inputs" columnar format REST style.
-        #   Columnar format means each named input can have a list of values, but we actually are only submitting
-        #   one at a time here.
-        #   label_ids is a scalar (placeholder shape [None]).
+        #   Columnar format means each named input has a list of values, one
+        #   per example in the batch.
+        #   label_ids is a scalar per example (placeholder shape [None]).
         evalue = {
-            "input_ids": [input_ids],
-            "input_mask": [input_mask],
-            "label_ids": label_ids,
-            "segment_ids": [segment_ids],
+            "input_ids": np.stack([e["input_ids"] for e in examples]),
+            "input_mask": np.stack([e["input_mask"] for e in examples]),
+            "label_ids": [0] * len(examples),  # dummy, not needed for prediction
+            "segment_ids": np.stack([e["segment_ids"] for e in examples]),
         }
-        req_json = json.dumps({
+        req_json = encode_json_request({
             "signature_name": "serving_default",
             "inputs":  evalue,
         })
-        log.debug("BERT: request to %s is: %s ... %s",
+        log.debug("BERT: request (batch of %d) to %s is: %s ... %s",
+            len(examples),
             self.bert_tf_server_url + ":predict",
             req_json[:80],
             req_json[len(req_json)-50:],
         )
 
-        response = requests.post(
+        response = self.http.post(
             self.bert_tf_server_url + ":predict",
             data=req_json,
             headers=self.json_content_header,
+            timeout=self.http_timeout,
         )
         response.raise_for_status()
-        response_vec = response.json()["outputs"][0]
-        confidence_other = response_vec[0]
-        confidence_research = response_vec[1]
-        log.debug("bert classify %s  other=%.2f research=%.2f",
-            trace_id, confidence_other, confidence_research)
-        if confidence_research > confidence_other:
-            ret = self.encode_confidence("research", confidence_research)
-        else:
-            ret = self.encode_confidence("other", confidence_other)
-        return ret
+        return response.json()["outputs"]
 
 
-    def classify_pdf_image(self, img_as_array, trace_name):
+    def predict_image_batch(self, images):
         """
-        Apply image model to content image using tensorflow-serving.
+        Run one tensorflow-serving image prediction for a batch of images.
 
-        :param img_as_array: image as array with shape (299. 299, 3).
-        :param trace_name: name for tracing an example, used in log msgs.
-        :return: encoded confidence as type float with range [0.5,1.0] that example is positive
+        :param images: list of image arrays, each with shape (IMAGE_SIZE, IMAGE_SIZE, 3).
+        :return: list of [confidence_other, confidence_research], one per image.
         """
-        # make array of image arrays
-        my_images = np.reshape(img_as_array, (-1, 299, 299, 3))
-        req_json = json.dumps({
+        if self.image_input_format == "raw_b64":
+            # one base64 string of tensor bytes per image, instead of ~268k numbers
+            instances = [
+                {"b64": base64.b64encode(
+                    np.ascontiguousarray(img, dtype=self.image_input_dtype).tobytes()).decode('ascii')}
+                for img in images
+            ]
+        elif self.image_input_format == "jpeg_b64":
+            # tens of KB per image
+            instances = [{"b64": pdf_util.encode_image_jpeg_b64(img)} for img in images]
+        else:
+            # stack into one array of image arrays
+            instances = np.stack(images)
+        req_json = encode_json_request({
             "signature_name": "serving_default",
-            "instances": my_images.tolist(),
+            "instances": instances,
         })
 
-        response = requests.post(
+        response = self.http.post(
             self.image_tf_server_url + ":predict",
             data=req_json,
             headers=self.json_content_header,
+            timeout=self.http_timeout,
         )
         response.raise_for_status()
-        response_vec = response.json()["predictions"][0]
-        confidence_other = response_vec[0]
-        confidence_research = response_vec[1]
-        log.debug("image classify %s  other=%.2f research=%.2f",
-            trace_name, confidence_other, confidence_research)
-        if confidence_research > confidence_other:
-            ret = self.encode_confidence("research", confidence_research)
-        else:
-            ret = self.encode_confidence("other", confidence_other)
-        return ret
-
+        return response.json()["predictions"]
@@ -19,20 +19,120 @@ limitations under the License.
 
 """
 PDF processing.
-We use pdftotext (exec'ed) because it works more often than PyPDF2.
-Images from PDFs are created by ImageMagick (and ghostscript).
+We use pdftotext (exec'ed, or optionally the poppler python binding) because
+it works more often than PyPDF2.
+Images from PDFs are created by ImageMagick (and ghostscript), or optionally
+in-process by PDFium.
 """
 
 from io import BytesIO
+import os
+import base64
+import re
 import time
+import asyncio
 import shutil
 import subprocess
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import numpy as np
 from cv2 import cv2  # pip install opencv-python  to get this
+try:
+    import pypdfium2 as pdfium  # optional, pip install pypdfium2
+except ImportError:
+    pdfium = None
+try:
+    import pdftotext  # optional, pip install pdftotext (needs libpoppler-cpp)
+except ImportError:
+    pdftotext = None
+
+from pdf_trio.cache import LruCache, content_key
 
 log = logging.getLogger(__name__)
 
+# "exec" (default, runs the pdftotext command) or "poppler" (in-process binding)
+TEXT_EXTRACTOR = os.environ.get('PDFTRIO_TEXT_EXTRACTOR') or "exec"
+if TEXT_EXTRACTOR == "poppler" and pdftotext is None:
+    print("ERROR: PDFTRIO_TEXT_EXTRACTOR=poppler but the pdftotext python package is not installed, using exec")
+    log.error("pdftotext python package is not installed, falling back to exec for text")
+    TEXT_EXTRACTOR = "exec"
+
+# seconds allowed for extracting text or an image from one PDF
+EXTRACT_TIMEOUT = 30
+
+# in-process extraction runs here so that a timeout can be applied
+_EXTRACT_POOL = ThreadPoolExecutor(max_workers=(os.cpu_count() or 2) * 2,
+                                   thread_name_prefix="pdftrio-extract")
+
+# "imagemagick" (default, same as the training data prep) or "pdfium"
+IMAGE_RENDERER = os.environ.get('PDFTRIO_IMAGE_RENDERER') or "imagemagick"
+if IMAGE_RENDERER == "pdfium" and pdfium is None:
+    print("ERROR: PDFTRIO_IMAGE_RENDERER=pdfium but pypdfium2 is not installed, using imagemagick")
+    log.error("pypdfium2 is not installed, falling back to imagemagick for images")
+    IMAGE_RENDERER = "imagemagick"
+
+# PDFium is not thread-safe
+_pdfium_lock = threading.Lock()
+
+# page image geometry, these must match training to maximize accuracy:
+#   first page at THUMB_WIDTH wide, top-centered on a white square of RENDER_SIZE,
+#   then resized (if different) to IMAGE_SIZE, the input size of the image model
+RENDER_SIZE = int(os.environ.get('PDFTRIO_RENDER_SIZE') or 224)
+THUMB_WIDTH = round(156 * RENDER_SIZE / 224)
+IMAGE_SIZE = int(os.environ.get('PDFTRIO_IMG_SIZE') or 299)
+
+# OpenCV interpolation for that resize, by name; by default INTER_LINEAR (as in
+# training) when enlarging and INTER_AREA when shrinking. Only these are
+# accepted: other INTER_ constants (INTER_MAX, INTER_BITS, ...) are not
+# interpolations which cv2.resize() takes.
+RESIZE_INTERPS = ("INTER_NEAREST", "INTER_LINEAR", "INTER_AREA", "INTER_CUBIC", "INTER_LANCZOS4",
+                  "INTER_LINEAR_EXACT", "INTER_NEAREST_EXACT")
+RESIZE_INTERP_NAME = os.environ.get('PDFTRIO_RESIZE') or None
+if RESIZE_INTERP_NAME and not (RESIZE_INTERP_NAME in RESIZE_INTERPS and hasattr(cv2, RESIZE_INTERP_NAME)):
+    print("ERROR: PDFTRIO_RESIZE=%s is not one of %s (in this OpenCV), using the default"
+          % (RESIZE_INTERP_NAME, ", ".join(RESIZE_INTERPS)))
+    log.error("unknown PDFTRIO_RESIZE interpolation %s, using the default" % RESIZE_INTERP_NAME)
+    RESIZE_INTERP_NAME = None
+if RESIZE_INTERP_NAME:
+    RESIZE_INTERP = getattr(cv2, RESIZE_INTERP_NAME)
+elif IMAGE_SIZE < RENDER_SIZE:
+    RESIZE_INTERP = cv2.INTER_AREA
+else:
+    RESIZE_INTERP = cv2.INTER_LINEAR
+
+# specify UTF-8 for output
+PDFTOTEXT_CMD = ['pdftotext', '-nopgbrk', '-eol', 'unix', '-enc', 'UTF-8', "-", "-"]
+
+# convert arguments after the input pages; the parameters here must match
+# training to maximize accuracy. The output is uncompressed ppm rather than
+# jpg, there is no need to encode and decode; 8 bits per sample, as a jpg has
+# (a Q16 ImageMagick build may otherwise write 16 bit samples)
+CONVERT_ARGS = ['-background', 'white', '-alpha', 'remove', '-equalize',
+                '-thumbnail', '%dx' % THUMB_WIDTH, '-gravity', 'north', '-extent',
+                '%dx%d' % (RENDER_SIZE, RENDER_SIZE), '-depth', '8', "ppm:-"]
+
+# same as the training data
+JPEG_QUALITY = 95
+
+# as for the training data, a page whose (RENDER_SIZE) image encodes to a jpg
+# of fewer than this many bytes (at JPEG_QUALITY) is blank; it was found
+# empirically for 224x224 images
+BLANK_JPG_SIZE = 3000
+
+# the jpg is encoded as ImageMagick wrote the training jpgs: optimized huffman
+# tables, no chroma subsampling at quality 90 or more, and one (gray) channel
+# for a page with no color; opencv before 4.5.5 cannot set the subsampling,
+# so color pages encode smaller there
+BLANK_JPG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+if hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):
+    BLANK_JPG_PARAMS += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444]
+
+# recently rendered page images (as uint8, about 150KB each) by PDF content and page, so
+# that a PDF submitted again (retried, or with other modes) is not re-rendered
+_image_cache = LruCache(int(os.environ.get('PDFTRIO_IMAGE_CACHE_SIZE') or 128))
+_NOT_CACHED = object()
+
 if not shutil.which('pdftotext'):
     print("ERROR: you do not have pdftotext installed. Install it first before calling this script")
     log.error("the required executable pdftotext is not installed")
@@ -49,21 +149,30 @@ def extract_pdf_text(pdf_content, trace_name):
     :param trace_name the filename on the client, for traceability
     :return: text string of extracted human readable text from PDF, zero length string if could not extract or no text.
     """
-    text = ""
-    # specify UTF-8 for output
-    p_args = ['pdftotext', '-nopgbrk', '-eol', 'unix', '-enc', 'UTF-8', "-", "-"]
+    return extract_pdf_text_status(pdf_content, trace_name)[0]
+
+
+def extract_pdf_text_status(pdf_content, trace_name):
+    """
+    Like extract_pdf_text(), also telling whether extraction completed.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :return: tuple of (text, complete) where text is as returned by
+    extract_pdf_text(); complete is False if extraction failed or timed out,
+    so that the text may be partial (or empty) and should not be kept.
+    """
+    if TEXT_EXTRACTOR == "poppler":
+        return extract_pdf_text_poppler(pdf_content, trace_name)
     t0 = time.time()
     # start subprocess, encoding not specified since input must be binary
-    pp = subprocess.Popen(p_args, bufsize=262144, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    # pump the content into stdin
-    try:
-        pp.stdin.write(pdf_content)
-    except IOError:
-        pass
+    pp = subprocess.Popen(PDFTOTEXT_CMD, bufsize=262144, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     text_binary = b""
-    # wait to finish, drain pipes
+    complete = True
+    # pump the content into stdin while draining the pipes; communicate()
+    # writes straight from the caller's buffer, no copy is made
     try:
-        outs, errs = pp.communicate(timeout=30)
+        outs, errs = pp.communicate(input=pdf_content, timeout=EXTRACT_TIMEOUT)
         # outs and errs are file handles
         #  outs was read as binary, but it is actually UTF-8, so we decode here
         text_binary = outs
@@ -71,74 +180,473 @@ def extract_pdf_text(pdf_content, trace_name):
         pp.kill()
         # drain residue so subprocess can really finish
         outs, errs = pp.communicate()
-        text = outs  # get at least some text from file
+        text_binary = outs  # get at least some text from file
+        complete = False
         log.warning("pdftotext, processing for %s did not terminate in %.2f seconds, terminating." %
                     (trace_name, time.time() - t0))
+    return decode_pdftotext_output(text_binary, trace_name), complete
+
+
+async def extract_pdf_text_async(pdf_content, trace_name):
+    """
+    Like extract_pdf_text(), as a coroutine: the pdftotext process is driven by
+    the event loop, so one thread can wait on many of them (eg, under an
+    ASGI server).
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :return: text string of extracted human readable text from PDF, zero length string if could not extract or no text.
+    """
+    if TEXT_EXTRACTOR == "poppler":
+        text, _ = await asyncio.get_running_loop().run_in_executor(
+            None, extract_pdf_text_poppler, pdf_content, trace_name)
+        return text
+    t0 = time.time()
+    # stderr is not used, so it is not piped (a full pipe would block pdftotext)
+    pp = await asyncio.create_subprocess_exec(
+        *PDFTOTEXT_CMD, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    chunks = []
+
+    async def pump():
+        pp.stdin.write(pdf_content)
+        try:
+            await pp.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # pdftotext gave up on the input, its output still matters
+        pp.stdin.close()
+
+    async def drain():
+        while True:
+            chunk = await pp.stdout.read(262144)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(pump(), drain()), timeout=EXTRACT_TIMEOUT)
+    except asyncio.TimeoutError:
+        pp.kill()
+        log.warning("pdftotext, processing for %s did not terminate in %.2f seconds, terminating." %
+                    (trace_name, time.time() - t0))
+    await pp.wait()
+    # get at least some text from file, if it timed out
+    return decode_pdftotext_output(b"".join(chunks), trace_name)
+
+
+def decode_pdftotext_output(text_binary, trace_name):
+    """
+    :param text_binary: output of pdftotext.
+    :param trace_name the filename on the client, for traceability
+    :return: text string, zero length string if it is not UTF-8.
+    """
     # convert from binary utf-8 string to text string
     try:
-        text = text_binary.decode("utf-8")
+        return text_binary.decode("utf-8")
     except UnicodeError:
         log.warning("pdftotext, processing for %s utf-8 decode exception occurred." % (trace_name))
-    return text
+    return ""
+
+
+def extract_pdf_text_poppler(pdf_content, trace_name):
+    """
+    Extract text in-process with the poppler binding, in the same reading order
+    as the pdftotext command, without forking for every PDF.
+
+    A timed out extraction cannot be interrupted, it carries on in its pool
+    thread and its result is discarded.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :return: tuple of (text, complete) as for extract_pdf_text_status().
+    """
+    t0 = time.time()
+    future = _EXTRACT_POOL.submit(_poppler_text, pdf_content)
+    try:
+        return future.result(timeout=EXTRACT_TIMEOUT), True
+    except FutureTimeoutError:
+        log.warning("poppler, processing for %s did not terminate in %.2f seconds, giving up." %
+                    (trace_name, time.time() - t0))
+    except pdftotext.Error as e:
+        log.warning("poppler, could not extract text for %s: %s" % (trace_name, e))
+    return "", False
+
+
+def _poppler_text(pdf_content):
+    return "\n".join(pdftotext.PDF(BytesIO(pdf_content)))
+
+
+def extract_pdf_text_and_image(pdf_content, trace_name, page=0):
+    """
+    Extract both the text and a page image, concurrently: the image is rendered
+    on the module pool while the text is extracted on the calling thread, so
+    the time taken is that of the slower of the two rather than their sum.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :param page:  page number (from 0) for the image
+    :return: tuple of (text, image) as returned by extract_pdf_text() and
+    extract_pdf_image().
+    """
+    image_future = _EXTRACT_POOL.submit(extract_pdf_image, pdf_content, trace_name, page)
+    text = extract_pdf_text(pdf_content, trace_name)
+    return text, image_future.result()
 
 
 def extract_pdf_image(pdf_content, trace_name, page=0):
     """
-    ImageMagick (and ghostscript) is used to generate the image.
+    ImageMagick (and ghostscript) or PDFium is used to generate the image.
 
-    Image is returned as an array of floats with shape (224, 224, 3).
+    Image is rendered with shape (RENDER_SIZE, RENDER_SIZE, 3), then resized for
+    the model to (IMAGE_SIZE, IMAGE_SIZE, 3); (224, 224, 3) and (299, 299, 3) by
+    default.
 
     :param pdf_content: as binary string object.
     :param trace_name the filename on the client, for traceability
     :param page:  page number (from 0)
-    :return: array of floats with shape (299, 299, 3), None is returned if no good image
+    :return: array of floats with shape (IMAGE_SIZE, IMAGE_SIZE, 3), None is returned if no good image
     produced.
     """
-    jpg_content = None
-    pageSpec = "[" + str(page) + "]"
+    return extract_pdf_images(pdf_content, trace_name, pages=(page,)).get(page)
+
+
+def extract_pdf_image_b64(pdf_content, trace_name, page=0):
+    """
+    Like extract_pdf_image(), as a JPEG for a tensorflow-serving "b64" string
+    input, which is far smaller than the pixel values.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :param page:  page number (from 0)
+    :return: base64 str of the JPEG encoded image, None is returned if no good
+    image produced.
+    """
+    img_array = extract_pdf_image(pdf_content, trace_name, page)
+    if img_array is None:
+        return None
+    return encode_image_jpeg_b64(img_array)
+
+
+def encode_image_jpeg_b64(img_array):
+    """
+    :param img_array: BGR array of pixel values, as from extract_pdf_image().
+    :return: base64 str of the image encoded as JPEG (in RGB, as all JPEG
+    decoders return it).
+    """
+    if img_array.dtype != np.uint8:
+        img_array = np.clip(np.rint(img_array), 0, 255).astype(np.uint8)
+    ok, jpg = cv2.imencode(".jpg", img_array, (cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY))
+    if not ok:
+        raise ValueError("could not encode image as jpg")
+    return base64.b64encode(jpg).decode('ascii')
+
+
+def extract_pdf_images(pdf_content, trace_name, pages=(0,)):
+    """
+    Like extract_pdf_image(), for several pages at once: the PDF is parsed only
+    once for all of them.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :param pages:  page numbers (from 0)
+    :return: dict of page number to array of floats with shape (IMAGE_SIZE, IMAGE_SIZE, 3),
+    pages which do not exist or gave no good image are left out.
+    """
+    return extract_pdf_images_status(pdf_content, trace_name, pages)[0]
+
+
+def extract_pdf_images_status(pdf_content, trace_name, pages=(0,)):
+    """
+    Like extract_pdf_images(), also telling whether rendering completed.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :param pages:  page numbers (from 0)
+    :return: tuple of (images, complete) where images is as returned by
+    extract_pdf_images(); complete is False if rendering failed or timed out,
+    so that pages left out may have an image when tried again.
+    """
+    pdf_key = content_key(pdf_content)
+    images = {}
+    missing = []
+    for page in sorted(set(pages)):
+        # a cached None records that the page gave no image
+        img_array = _image_cache.get((pdf_key, page), default=_NOT_CACHED)
+        if img_array is _NOT_CACHED:
+            missing.append(page)
+        elif img_array is not None:
+            images[page] = to_model_input(img_array)
+    if not missing:
+        return images, True
+    if IMAGE_RENDERER == "pdfium":
+        to_render = missing
+        rendered, complete = render_pages_pdfium(pdf_content, trace_name, missing)
+    else:
+        # do not run convert just to find that later pages do not exist; page
+        # 0 is always rendered, so counting is only needed for later pages
+        to_render = missing
+        if missing[-1] > 0:
+            count = page_count(pdf_content)
+            if count is not None:
+                to_render = [page for page in missing if page == 0 or page < count]
+        if to_render:
+            rendered, complete = render_pages_imagemagick(pdf_content, trace_name, to_render)
+        else:
+            rendered, complete = {}, True
+    for page in missing:
+        img_array = rendered.get(page)
+        if img_array is None:
+            # the page does not exist or is blank; unless rendering failed, in
+            # which case a retry must render it again. A page left out by the
+            # page count is not cached, in case the count was wrong.
+            if complete and page in to_render:
+                _image_cache.put((pdf_key, page), None)
+        else:
+            # the render is cached as uint8, a quarter the size of float32
+            img_array.setflags(write=False)
+            _image_cache.put((pdf_key, page), img_array)
+            images[page] = to_model_input(img_array)
+    return images, complete
+
+
+def to_model_input(img_array):
+    """
+    :param img_array: BGR array of uint8 with shape (RENDER_SIZE, RENDER_SIZE, 3), as rendered.
+    :return: new array of floats with shape (IMAGE_SIZE, IMAGE_SIZE, 3).
+    """
+    # resized in float32, as for training, the pixels are not rounded to integers
+    img_array = img_array.astype(np.float32)
+    if IMAGE_SIZE != RENDER_SIZE:
+        # by default we have 224x224, resize to 299x299 for the model
+        img_array = cv2.resize(img_array, dsize=(IMAGE_SIZE, IMAGE_SIZE),
+                               interpolation=RESIZE_INTERP)
+    return img_array
+
+
+# /Type /Pages, in either order with a /Count in the same (innermost) dictionary
+_pages_node_re = re.compile(rb"/Type\s*/Pages(?![A-Za-z0-9])")
+_pages_count_re = re.compile(
+    rb"/Type\s*/Pages(?![A-Za-z0-9])[^<>]*?/Count\s+(\d+)|/Count\s+(\d+)[^<>]*?/Type\s*/Pages(?![A-Za-z0-9])")
+
+
+def page_count(pdf_content):
+    """
+    Number of pages of a PDF, without rendering it: read by PDFium if it is
+    installed, otherwise from the /Count of the page tree nodes.
+
+    :param pdf_content: as binary string object.
+    :return: number of pages, or None if it could not be determined.
+    """
+    if pdfium is not None:
+        with _pdfium_lock:
+            try:
+                pdf = pdfium.PdfDocument(pdf_content)
+            except pdfium.PdfiumError:
+                return None
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    # page tree nodes inside compressed object streams can not be seen
+    if b"/ObjStm" in pdf_content:
+        return None
+    nodes = _pages_node_re.findall(pdf_content)
+    counts = _pages_count_re.findall(pdf_content)
+    # each node must have given its count, or the root (the largest, which
+    # is the page count; larger still if pages were removed by an update)
+    # may have been missed
+    if not nodes or len(counts) != len(nodes):
+        return None
+    return max(int(after or before) for after, before in counts)
+
+
+def render_pages_imagemagick(pdf_content, trace_name, pages=(0,)):
+    """
+    Render pages with ImageMagick (and ghostscript), in one convert run.
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :param pages:  sorted page numbers (from 0)
+    :return: tuple of (images, complete): dict of page number to BGR array of uint8 with
+    shape (RENDER_SIZE, RENDER_SIZE, 3), pages which do not exist or gave no good image
+    are left out; and False if convert failed or timed out.
+    """
+    ppm_content = None
+    pageSpec = "[" + ",".join(map(str, pages)) + "]"
     # start subprocess
     # Use pipes so that stderr can be collected (and not just mixed into main process stderr, hiding other errors)
-
-    # the parameters here must match training to maximize accuracy
-    convert_cmd = ['convert', "pdf:-" + pageSpec, '-background', 'white',
-                   '-alpha', 'remove', '-equalize', '-quality', '95',
-                   '-thumbnail', '156x', '-gravity', 'north', '-extent',
-                   '224x224', "jpg:-"]
+    convert_cmd = ['convert', "pdf:-" + pageSpec] + CONVERT_ARGS
     if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
         log.debug("ImageMagick Command=" + " ".join(convert_cmd))
     t0 = time.time()
     pp = subprocess.Popen(convert_cmd, bufsize=262144, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
                           stderr=subprocess.PIPE)
     try:
-        pp.stdin.write(pdf_content)
-    except IOError:
-        pass
-
-    try:
-        outs, errs = pp.communicate(timeout=30)
-        # get jpg bytes
-        jpg_content = outs
-        # check if jpg sufficient size
-        if len(jpg_content) <= 3000:
-            jpg_content = None  # probably a blank image, so ignore it
-            log.warning("ignoring blank jpg produced by imagemagick for %s" % trace_name)
+        outs, errs = pp.communicate(input=pdf_content, timeout=EXTRACT_TIMEOUT)
+        # get ppm bytes, one image after the other
+        ppm_content = outs
     except subprocess.TimeoutExpired:
         pp.kill()
         # drain residue so subprocess can really finish
         outs, errs = pp.communicate()
         log.warning("convert command (imagemagick) on %s did not terminate in %.2f seconds, terminating." %
                     (trace_name, time.time()-t0))
-    if jpg_content is None:
-        return None
-    # convert jpg_content to image as array
-    img_stream = BytesIO(jpg_content)
-    img_array = cv2.imdecode(np.frombuffer(img_stream.read(), np.uint8), cv2.IMREAD_COLOR)
-    if img_array is None:
-        log.warning("imdecode failed for %s" % (trace_name))
-        return None
-    img_array = img_array.astype(np.float32)
-    #img_array = cv2.imdecode(np.fromstring(img_stream.read(), np.uint8), cv2.IMREAD_COLOR).astype(np.float32)
-    # we have 224x224, resize to 299x299 for shape (224, 224, 3)
-    # ToDo: target size could vary, depending on the pre-trained model, should auto-adjust
-    img299 = cv2.resize(img_array, dsize=(299, 299), interpolation=cv2.INTER_LINEAR)
-    return img299
+    if not ppm_content:
+        # pages past the end alone give no error, so convert failed (or timed out)
+        if ppm_content is not None:
+            log.warning("convert command (imagemagick) produced no image for %s: %s" %
+                        (trace_name, errs.decode('utf-8', 'replace').strip()))
+        return {}, False
+    try:
+        frames = split_ppm_frames(ppm_content)
+    except ValueError as e:
+        log.warning("could not read the ppm produced by imagemagick for %s: %s" % (trace_name, e))
+        return {}, False
+    # pages past the end of the PDF produce no frame, so the frames are for
+    # the first (lowest) pages asked for
+    images = {}
+    for page, img_array in zip(pages, frames):
+        if is_blank_image(img_array):
+            log.warning("ignoring blank image produced by imagemagick for %s page %d" % (trace_name, page))
+            continue
+        images[page] = img_array
+    return images, True
+
+
+def split_ppm_frames(ppm_content):
+    """
+    Decode a stream of binary (P6) PPM images, as written by ImageMagick for a
+    multi-page output. Only the headers are parsed here, to find where each
+    image ends; OpenCV decodes them, of any sample depth.
+
+    :param ppm_content: bytes of one or more concatenated PPM images.
+    :return: list of BGR arrays of uint8 with shape (height, width, 3).
+    """
+    frames = []
+    buf = memoryview(ppm_content)
+    pos = 0
+    while pos < len(buf):
+        start_frame = pos
+        # header: magic, width, height, maxval, each separated by whitespace
+        # (and possibly comments), followed by a single whitespace char
+        fields = []
+        while len(fields) < 4:
+            while pos < len(buf) and buf[pos] in b" \t\r\n":
+                pos += 1
+            if pos < len(buf) and buf[pos] == ord("#"):
+                while pos < len(buf) and buf[pos] not in b"\r\n":
+                    pos += 1
+                continue
+            start = pos
+            while pos < len(buf) and buf[pos] not in b" \t\r\n#":
+                pos += 1
+            if pos == start:
+                break
+            fields.append(bytes(buf[start:pos]))
+        if not fields:
+            break
+        if len(fields) < 4 or fields[0] != b"P6" or not all(f.isdigit() for f in fields[1:]):
+            raise ValueError("unexpected ppm header %r" % b" ".join(fields))
+        width, height, maxval = int(fields[1]), int(fields[2]), int(fields[3])
+        if not 0 < maxval < 65536:
+            raise ValueError("unexpected ppm maxval %d" % maxval)
+        pos += 1
+        # samples of more than 8 bits take two bytes
+        size = width * height * 3 * (1 if maxval < 256 else 2)
+        if pos + size > len(buf):
+            raise ValueError("truncated ppm of %dx%d" % (width, height))
+        img_array = cv2.imdecode(np.frombuffer(buf[start_frame:pos + size], np.uint8), cv2.IMREAD_COLOR)
+        if img_array is None:
+            raise ValueError("imdecode failed for a ppm of %dx%d" % (width, height))
+        frames.append(img_array)
+        pos += size
+    return frames
+
+
+def render_pages_pdfium(pdf_content, trace_name, pages=(0,)):
+    """
+    Render pages in-process with PDFium, reproducing the ImageMagick steps
+    used for training: white background, equalize, thumbnail, extent (north).
+
+    :param pdf_content: as binary string object.
+    :param trace_name the filename on the client, for traceability
+    :param pages:  sorted page numbers (from 0)
+    :return: tuple of (images, complete): dict of page number to BGR array of uint8 with
+    shape (RENDER_SIZE, RENDER_SIZE, 3), pages which do not exist or gave no good image
+    are left out; and False if the PDF could not be opened.
+    """
+    thumbs = {}
+    with _pdfium_lock:
+        try:
+            pdf = pdfium.PdfDocument(pdf_content)
+        except pdfium.PdfiumError as e:
+            log.warning("pdfium could not open %s: %s" % (trace_name, e))
+            return {}, False
+        try:
+            page_count = len(pdf)
+            for page in pages:
+                if page >= page_count:
+                    log.debug("pdfium: %s has no page %d" % (trace_name, page))
+                    break
+                pdf_page = pdf[page]
+                width = pdf_page.get_width()
+                if width <= 0:
+                    log.warning("pdfium: page %d of %s has no width" % (page, trace_name))
+                    continue
+                # renders as BGR, same channel order as cv2.imdecode()
+                thumbs[page] = pdf_page.render(
+                    scale=THUMB_WIDTH / width,
+                    fill_color=(255, 255, 255, 255),
+                ).to_numpy()
+        finally:
+            pdf.close()
+    images = {}
+    for page, thumb in thumbs.items():
+        img_array = pdfium_thumb_to_page_image(thumb)
+        if is_blank_image(img_array):
+            log.warning("ignoring blank page rendered by pdfium for %s page %d" % (trace_name, page))
+            continue
+        images[page] = img_array
+    return images, True
+
+
+def pdfium_thumb_to_page_image(thumb):
+    """
+    :param thumb: BGR array of uint8, the page rendered THUMB_WIDTH wide.
+    :return: BGR array of uint8 with shape (RENDER_SIZE, RENDER_SIZE, 3).
+    """
+    # ImageMagick -equalize works on each channel separately
+    thumb = cv2.merge([cv2.equalizeHist(c) for c in cv2.split(thumb)])
+    # -gravity north -extent: center horizontally, keep top, pad with white
+    h = min(thumb.shape[0], RENDER_SIZE)
+    w = min(thumb.shape[1], RENDER_SIZE)
+    x_src = (thumb.shape[1] - w) // 2
+    thumb = thumb[:h, x_src:x_src + w]
+    left = (RENDER_SIZE - w) // 2
+    return cv2.copyMakeBorder(thumb, 0, RENDER_SIZE - h, left, RENDER_SIZE - w - left,
+        cv2.BORDER_CONSTANT, value=(255, 255, 255))
+
+
+def is_blank_image(img_array):
+    """
+    Blank pages are not classified, and were removed from the training data
+    by the same rule (see data_prep/image_data_prep/pdf_image.sh): the page
+    image is blank if its jpg is small. A page with only a page number on it
+    is blank too.
+
+    :param img_array: BGR array of uint8, the page image as rendered.
+    :return: True if the image is (nearly) blank.
+    """
+    return blank_jpg_size(img_array) < BLANK_JPG_SIZE
+
+
+def blank_jpg_size(img_array):
+    """
+    :param img_array: BGR array of uint8, the page image as rendered.
+    :return: size in bytes of the jpg which ImageMagick writes for the image
+    (see BLANK_JPG_PARAMS), 0 if it cannot be encoded.
+    """
+    if img_array.ndim == 3 and (img_array[:, :, 0] == img_array[:, :, 1]).all() \
+            and (img_array[:, :, 1] == img_array[:, :, 2]).all():
+        img_array = np.ascontiguousarray(img_array[:, :, 0])
+    ok, jpg = cv2.imencode(".jpg", img_array, BLANK_JPG_PARAMS)
+    return len(jpg) if ok else 0
@@ -23,6 +23,7 @@ import collections
 import re
 import logging
 import string
+import threading
 
 log = logging.getLogger("text_prep")
 
@@ -37,6 +38,14 @@ for i in range(8192, 8303):
         continue
     expanded_punct = expanded_punct + chr(i)
 
+# some of the unicode punctuation above is whitespace to str.split() (eg, em
+# space, line separator); it separates tokens, the rest is removed from them
+_separator_re = re.compile('[\x00-\x1F%s]+' % re.escape(
+    "".join(c for c in expanded_punct if c.isspace())))
+_punct_re = re.compile('[%s]+' % re.escape(
+    "".join(c for c in expanded_punct if not c.isspace())))
+
+
 def extract_tokens(str_content):
     """
     Clean given string and return the cleaned list of tokens.
@@ -44,14 +53,11 @@ def extract_tokens(str_content):
     :param str_content: raw string
     :return: token list, preserving order from document.
     """
-    # convert control and EOL chars to space
-    str_content = re.sub(r'[\x00-\x1F]+', ' ', str_content)
-    # split by whitespace
-    tokens = str_content.split()
-
-    ttable = str.maketrans('', '', expanded_punct)
-    tokens = [w.translate(ttable) for w in tokens]
-    return tokens
+    # convert control and EOL chars (and whitespace punctuation) to space
+    str_content = _separator_re.sub(' ', str_content)
+    # remove punctuation over the whole string at once, then split by
+    # whitespace; tokens which were only punctuation disappear
+    return _punct_re.sub('', str_content).split()
 
 
 def trim_tokens(file_token_list, max_tokens):
@@ -71,23 +77,31 @@ def trim_tokens(file_token_list, max_tokens):
     return file_token_list
 
 
+# vocabularies already loaded, by path
+_bert_vocab_cache = {}
+_bert_vocab_lock = threading.Lock()
+
+
 def load_bert_vocab(vocab_file):
     """
     Loads a vocabulary file into a dictionary.
+    Each path is only loaded once per process; callers share the result and
+    must not modify it.
     :param vocab_file:  path to vocab.txt from pre-trained BERT model
     :return: dictionary.
     """
-    vocab = collections.OrderedDict()
-    index = 0
-    with open(vocab_file, 'r', encoding='utf-8') as file:
-        while True:
-            token = file.readline()
-            if not token:
-                break
-            token = token.strip()
-            vocab[token] = index
-            index += 1
-    return vocab
+    with _bert_vocab_lock:
+        vocab = _bert_vocab_cache.get(vocab_file)
+        if vocab is not None:
+            return vocab
+        with open(vocab_file, 'rb') as file:
+            lines = file.read().decode('utf-8').split('\n')
+        if lines and lines[-1] == '':
+            lines.pop()  # after the final EOL
+        vocab = collections.OrderedDict(
+            (token.strip(), index) for index, token in enumerate(lines))
+        _bert_vocab_cache[vocab_file] = vocab
+        return vocab
 
 
 def convert_to_bert_vocab(vocab, items):
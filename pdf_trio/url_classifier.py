@@ -109,14 +109,21 @@ class UrlClassifier:
         r = " U_".join(tlist)
         return r
 
+    @staticmethod
+    def url_to_tokens(url):
+        """
+        :return: the string of tokens given to the model for url
+        """
+        return UrlClassifier.gen_tokens(
+            UrlClassifier.extract_url_tokens(UrlClassifier.remove_wayback_prefix(url)),
+        )
+
     def classify_url(self, url):
         """
         :param url: one URL to classify
         :return: confidence [0.0,1.0] that url points to positive case
         """
-        tokens_concat = UrlClassifier.gen_tokens(
-            self.extract_url_tokens(self.remove_wayback_prefix(url)),
-        )
+        tokens_concat = UrlClassifier.url_to_tokens(url)
         log.debug("classify_url: url=%s tokens=%s" % (url, tokens_concat))
         #  classify using fastText model for urlmeta
         results = self.fasttext_url_model.predict(tokens_concat)
@@ -125,3 +132,20 @@ class UrlClassifier:
         log.info("classify_url: label=%s confidence=%.2f url=%s" % (label, confidence, url))
         return pdf_classifier.PdfClassifier.encode_confidence(label, confidence)
 
+    def classify_urls(self, urls):
+        """
+        Classify a list of URLs with one call of the model, instead of a call
+        (and its overhead) per URL.
+
+        :param urls: list of URLs to classify
+        :return: list of confidences [0.0,1.0] that each url points to positive case, in the same order
+        """
+        if not urls:
+            return []
+        labels, confidences = self.fasttext_url_model.predict(
+            [UrlClassifier.url_to_tokens(url) for url in urls])
+        results = []
+        for url, url_labels, url_confidences in zip(urls, labels, confidences):
+            log.info("classify_urls: label=%s confidence=%.2f url=%s" % (url_labels[0], url_confidences[0], url))
+            results.append(pdf_classifier.PdfClassifier.encode_confidence(url_labels[0], url_confidences[0]))
+        return results
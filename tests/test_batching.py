@@ -0,0 +1,45 @@
+
+import threading
+import pytest
+
+from pdf_trio.batching import Batcher
+
+
+def test_batcher_coalesces_concurrent_calls():
+    batch_sizes = []
+
+    def double_all(examples):
+        batch_sizes.append(len(examples))
+        return [2 * e for e in examples]
+
+    b = Batcher(double_all, max_batch_size=8, max_latency_ms=200)
+    futures = [b.submit(i) for i in range(20)]
+    assert [f.result(timeout=5) for f in futures] == [2 * i for i in range(20)]
+    assert sum(batch_sizes) == 20
+    assert max(batch_sizes) <= 8
+    assert len(batch_sizes) < 20
+
+    # blocking calls from several threads
+    results = {}
+    def worker(i):
+        results[i] = b(i)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: 2 * i for i in range(10)}
+
+
+def test_batcher_propagates_errors():
+
+    def fail(examples):
+        raise RuntimeError("backend down")
+
+    b = Batcher(fail, max_batch_size=4, max_latency_ms=0)
+    with pytest.raises(RuntimeError):
+        b(1)
+
+    b = Batcher(lambda examples: [], max_batch_size=4, max_latency_ms=0)
+    with pytest.raises(ValueError):
+        b(1)
@@ -64,3 +64,12 @@ def test_pdf_classifier_basics():
             assert resp['ensemble_score'] != 0.5
 
     assert len(responses.calls) == 6
+
+    # identical PDF (and modes) again is answered from the result cache
+    with open(test_pdf_path, 'rb') as f:
+        pdf_content = f.read()
+        resp = c.classify_pdf_multi("all", pdf_content, test_pdf_path)
+        assert resp['ensemble_score'] != 0.5
+        assert 'result_cache' in resp['timing']
+
+    assert len(responses.calls) == 6
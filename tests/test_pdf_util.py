@@ -1,8 +1,11 @@
 
 import os
+import asyncio
+import subprocess
 
 from pdf_trio import pdf_util
 import numbers as np
+import numpy
 
 
 def test_extract_pdf_text():
@@ -32,3 +35,186 @@ def test_extract_pdf_image():
     img_as_array = pdf_util.extract_pdf_image(pdf_content, test_pdf_path, page=2)
     # shape is (299, 299, 3)
     assert img_as_array is None
+
+
+def test_extract_pdf_text_and_image():
+
+    test_pdf_path = 'tests/files/research/fea48178ffac3a42035ed27d6e2b897cb570cf13.pdf'
+    with open(test_pdf_path, 'rb') as f:
+        pdf_content = f.read()
+    text, img_as_array = pdf_util.extract_pdf_text_and_image(pdf_content, test_pdf_path)
+
+    assert "Yoshiyuki" in text
+    assert img_as_array is not None
+    assert img_as_array.shape == (299, 299, 3)
+
+
+def test_extract_pdf_images():
+
+    test_pdf_path = 'tests/files/research/submission_363.pdf'
+    with open(test_pdf_path, 'rb') as f:
+        pdf_content = f.read()
+    # the pdf has only one page, so page 2 is left out
+    images = pdf_util.extract_pdf_images(pdf_content, test_pdf_path, pages=(0, 2))
+    assert list(images.keys()) == [0]
+    assert images[0].shape == (299, 299, 3)
+
+
+def test_page_count():
+
+    test_pdf_path = 'tests/files/research/submission_363.pdf'
+    with open(test_pdf_path, 'rb') as f:
+        pdf_content = f.read()
+    assert pdf_util.page_count(pdf_content) == 1
+    assert pdf_util.page_count(b"not a pdf") is None
+
+
+def test_extract_pdf_text_async():
+
+    test_pdf_path = 'tests/files/research/fea48178ffac3a42035ed27d6e2b897cb570cf13.pdf'
+    with open(test_pdf_path, 'rb') as f:
+        pdf_content = f.read()
+    text = asyncio.run(pdf_util.extract_pdf_text_async(pdf_content, test_pdf_path))
+
+    assert text == pdf_util.extract_pdf_text(pdf_content, test_pdf_path)
+    assert "Yoshiyuki" in text
+
+
+def test_is_blank_image():
+
+    page = numpy.full((224, 224, 3), 255, dtype=numpy.uint8)
+    assert pdf_util.is_blank_image(page)
+    # eg, nothing but a page number, is blank as for the training data
+    page[200:206, 110:114] = 0
+    assert pdf_util.is_blank_image(page)
+    page[:] = numpy.random.RandomState(0).randint(0, 256, size=page.shape)
+    assert not pdf_util.is_blank_image(page)
+    # a gray page is encoded as one channel, as ImageMagick does
+    page[:, :, 1] = page[:, :, 2] = page[:, :, 0]
+    assert pdf_util.blank_jpg_size(page) == pdf_util.blank_jpg_size(page[:, :, 0].copy())
+
+
+def test_blank_jpg_size():
+
+    # the training jpgs, as written by convert in data_prep/image_data_prep/pdf_image.sh
+    for test_pdf_path in ['tests/files/research/submission_363.pdf',
+                          'tests/files/research/fea48178ffac3a42035ed27d6e2b897cb570cf13.pdf']:
+        with open(test_pdf_path, 'rb') as f:
+            pdf_content = f.read()
+        jpg = subprocess.run(['convert', 'pdf:-[0]', '-background', 'white', '-alpha', 'remove',
+                              '-equalize', '-quality', '95', '-thumbnail', '156x', '-gravity', 'north',
+                              '-extent', '224x224', 'jpg:-'],
+                             input=pdf_content, stdout=subprocess.PIPE, check=True).stdout
+        frames = pdf_util.split_ppm_frames(subprocess.run(
+            ['convert', 'pdf:-[0]'] + pdf_util.CONVERT_ARGS,
+            input=pdf_content, stdout=subprocess.PIPE, check=True).stdout)
+        # the same encoder settings, so within rounding of the libjpeg builds
+        assert abs(pdf_util.blank_jpg_size(frames[0]) - len(jpg)) <= 0.02 * len(jpg)
+        assert pdf_util.is_blank_image(frames[0]) == (len(jpg) < pdf_util.BLANK_JPG_SIZE)
+
+
+def test_split_ppm_frames():
+
+    rgb8 = numpy.arange(2 * 3 * 3, dtype=numpy.uint8).reshape(2, 3, 3)
+    rgb16 = numpy.arange(3 * 2 * 3, dtype='>u2').reshape(3, 2, 3) * 4000
+    ppm_content = (b"P6\n3 2\n255\n" + rgb8.tobytes() +
+                   b"P6\n# 16 bit samples\n2 3\n65535\n" + rgb16.tobytes())
+    frames = pdf_util.split_ppm_frames(ppm_content)
+    assert len(frames) == 2
+    # BGR, as from cv2.imdecode()
+    assert (frames[0] == rgb8[:, :, ::-1]).all()
+    assert frames[1].dtype == numpy.uint8
+    assert frames[1].shape == (3, 2, 3)
+
+
+def test_render_pages_imagemagick():
+
+    # decodes the actual ppm output of convert
+    test_pdf_path = 'tests/files/research/submission_363.pdf'
+    with open(test_pdf_path, 'rb') as f:
+        pdf_content = f.read()
+    images, complete = pdf_util.render_pages_imagemagick(pdf_content, test_pdf_path, pages=[0])
+    assert complete
+    assert list(images.keys()) == [0]
+    assert images[0].shape == (pdf_util.RENDER_SIZE, pdf_util.RENDER_SIZE, 3)
+    assert images[0].dtype == numpy.uint8
+
+
+class FakeProcess:
+    """
+    Stands in for a subprocess (convert, pdftotext); each run takes the next of
+    outputs, None for one which times out.
+    """
+    outputs = []
+
+    def __init__(self, args, **kwargs):
+        self.outs = FakeProcess.outputs.pop(0)
+
+    def communicate(self, input=None, timeout=None):
+        if self.outs is None and timeout is not None:
+            raise subprocess.TimeoutExpired('convert', timeout)
+        return self.outs or b"", b""
+
+    def kill(self):
+        pass
+
+
+def test_extract_pdf_images_timeout_not_cached(monkeypatch):
+
+    monkeypatch.setattr(pdf_util, 'IMAGE_RENDERER', "imagemagick")
+    monkeypatch.setattr(pdf_util.subprocess, 'Popen', FakeProcess)
+    size = pdf_util.RENDER_SIZE
+    page = numpy.random.RandomState(0).randint(0, 256, size=(size, size, 3), dtype=numpy.uint8)
+    FakeProcess.outputs = [None, b"P6\n%d %d\n255\n" % (size, size) + page.tobytes()]
+    pdf_content = b"%PDF-1.4 not really a pdf, for a convert timeout"
+
+    images, complete = pdf_util.extract_pdf_images_status(pdf_content, 'timeout.pdf')
+    assert images == {}
+    assert not complete
+    # rendered again, not "no image" from the cache
+    images, complete = pdf_util.extract_pdf_images_status(pdf_content, 'timeout.pdf')
+    assert complete
+    assert list(images.keys()) == [0]
+    assert FakeProcess.outputs == []
+    # and now cached
+    assert list(pdf_util.extract_pdf_images(pdf_content, 'timeout.pdf').keys()) == [0]
+
+
+def test_extract_pdf_images_page_count(monkeypatch):
+
+    monkeypatch.setattr(pdf_util, 'IMAGE_RENDERER', "imagemagick")
+    monkeypatch.setattr(pdf_util.subprocess, 'Popen', FakeProcess)
+    size = pdf_util.RENDER_SIZE
+    page = numpy.random.RandomState(0).randint(0, 256, size=(size, size, 3), dtype=numpy.uint8)
+    ppm_page = b"P6\n%d %d\n255\n" % (size, size) + page.tobytes()
+    pdf_content = b"%PDF-1.4 not really a pdf, with a wrong page count"
+
+    # page 0 alone is rendered without counting pages
+    def no_page_count(pdf_content):
+        raise AssertionError("page_count() called for page 0")
+    monkeypatch.setattr(pdf_util, 'page_count', no_page_count)
+    FakeProcess.outputs = [ppm_page]
+    assert list(pdf_util.extract_pdf_images(pdf_content, 'count.pdf').keys()) == [0]
+    # page 1 is left out by the (wrong) count, but not cached as no image
+    monkeypatch.setattr(pdf_util, 'page_count', lambda pdf_content: 1)
+    images, complete = pdf_util.extract_pdf_images_status(pdf_content, 'count.pdf', pages=(0, 1))
+    assert complete
+    assert list(images.keys()) == [0]
+    monkeypatch.setattr(pdf_util, 'page_count', lambda pdf_content: None)
+    FakeProcess.outputs = [ppm_page]
+    assert list(pdf_util.extract_pdf_images(pdf_content, 'count.pdf', pages=(0, 1)).keys()) == [0, 1]
+    assert FakeProcess.outputs == []
+
+
+def test_extract_pdf_text_timeout(monkeypatch):
+
+    monkeypatch.setattr(pdf_util, 'TEXT_EXTRACTOR', "exec")
+    monkeypatch.setattr(pdf_util.subprocess, 'Popen', FakeProcess)
+    FakeProcess.outputs = [None, b"some text"]
+
+    text, complete = pdf_util.extract_pdf_text_status(b"%PDF-1.4", 'timeout.pdf')
+    assert text == ""
+    assert not complete
+    text, complete = pdf_util.extract_pdf_text_status(b"%PDF-1.4", 'timeout.pdf')
+    assert text == "some text"
+    assert complete
@@ -16,3 +16,14 @@ def test_url_classify():
     resp = u.classify_url("https://web.archive.org/web/20200102030405/http://fatcat.wiki/one.pdf")
     assert type(resp) == float
     assert resp != 0.5
+
+def test_url_classify_batch():
+
+    u = UrlClassifier()
+    urls = [
+        "https://web.archive.org/web/20200102030405/http://fatcat.wiki/one.pdf",
+        "http://arxiv.org/pdf/1234.5678.pdf",
+    ]
+    resp = u.classify_urls(urls)
+    assert resp == [u.classify_url(url) for url in urls]
+    assert u.classify_urls([]) == []